@@ -0,0 +1,237 @@
+import pandas as pd
+import numpy as np
+
+from io_utils import save_csv_atomic
+
+class CampaignRollup:
+    # Dimensions that can be rolled up, mapped to the key column used in the cubes
+    DIMENSIONS = {
+        'campaign': 'CampaignID',
+        'channel': 'ChannelID',
+        'audience': 'AudienceID',
+        'store': 'StoreID'
+    }
+    METRICS = ['Impressions', 'Clicks', 'Conversions', 'BudgetSpend']
+
+    # Member ID for campaigns without any row in a bridge table, so dimension rollups still add up to the campaign totals
+    UNASSIGNED = -1
+
+    def __init__(self):
+        # Load the marketing tables and their bridge tables
+        self.campaigns = pd.read_csv('data/Marketing_Campaigns.csv')
+        self.campaign_results = pd.read_csv('data/Campaign_Results.csv')
+        self.channels = pd.read_csv('data/Channels.csv')
+        self.channels_stores = pd.read_csv('data/Channels_Campaigns.csv')
+        self.audiences = pd.read_csv('data/Audiences.csv')
+        self.audiences_campaigns = pd.read_csv('data/Audiences_Campaigns.csv')
+        self.stores_campaigns = pd.read_csv('data/Stores_Campaigns.csv')
+        self.stores = pd.read_csv('data/Stores.csv')
+        self.orders_segmented = pd.read_csv('data/Orders_Segmented.csv')
+
+        # Column names are not consistent across the raw files
+        self.channels = self.channels.rename(columns={'channelID': 'ChannelID', 'name': 'Name', 'type': 'Type'})
+        self.channels_stores = self.channels_stores.rename(columns={'channelID': 'ChannelID'})
+        self.audiences_campaigns = self.audiences_campaigns.rename(columns={'audienceID': 'AudienceID'})
+
+        # Empty initialization to be filled out by build_indexes() and build_cubes()
+        self.bridges = {}
+        self.campaign_index = {}
+        self.daily_cube = None
+        self.dimension_cubes = {}
+        self.segment_cube = None
+
+    def build_indexes(self):
+        # Bridge tables from each campaign to the members of a dimension, deduplicated once
+        campaign_stores = self.stores_campaigns[['CampaignID', 'StoreID']].drop_duplicates()
+
+        # Channels_Campaigns links channels to stores, so channels reach campaigns through the stores running them
+        campaign_channels = (
+            campaign_stores.merge(self.channels_stores[['StoreID', 'ChannelID']], on='StoreID')
+            [['CampaignID', 'ChannelID']].drop_duplicates()
+        )
+        campaign_audiences = self.audiences_campaigns[['CampaignID', 'AudienceID']].drop_duplicates()
+
+        # Each campaign's metrics are split evenly across its members, and campaigns missing from a bridge
+        # go to the UNASSIGNED member, so every dimension's rollup adds up to the campaign totals
+        campaign_ids = pd.Index(self.campaigns['CampaignID']).union(self.campaign_results['CampaignID'].unique())
+        for name, bridge in [('store', campaign_stores), ('channel', campaign_channels), ('audience', campaign_audiences)]:
+            key = self.DIMENSIONS[name]
+            unlinked = campaign_ids.difference(bridge['CampaignID'].unique())
+            bridge = pd.concat([bridge, pd.DataFrame({'CampaignID': unlinked, key: self.UNASSIGNED})], ignore_index=True)
+            bridge['Weight'] = 1 / bridge.groupby('CampaignID')['CampaignID'].transform('size')
+            self.bridges[name] = bridge
+
+        # Lookup from CampaignID to everything connected to it
+        campaigns = self.campaigns.set_index('CampaignID')
+        for campaign_id, row in campaigns.iterrows():
+            self.campaign_index[campaign_id] = {
+                'Name': row['Name'],
+                'StartDate': pd.to_datetime(row['StartDate']).normalize(),
+                'EndDate': pd.to_datetime(row['EndDate']).normalize(),
+                'Budget': row['Budget'],
+                'StoreIDs': [],
+                'ChannelIDs': [],
+                'AudienceIDs': [],
+                'RetailerIDs': []
+            }
+
+        for name, bridge in self.bridges.items():
+            key = self.DIMENSIONS[name]
+            linked = bridge.loc[bridge[key] != self.UNASSIGNED]
+            for campaign_id, members in linked.groupby('CampaignID')[key]:
+                if campaign_id in self.campaign_index:
+                    self.campaign_index[campaign_id][f'{key}s'] = sorted(members.tolist())
+
+        store_retailers = self.stores.set_index('StoreID')['RetailerID']
+        for campaign_id, entry in self.campaign_index.items():
+            entry['RetailerIDs'] = sorted(store_retailers.reindex(entry['StoreIDs']).dropna().astype(int).unique().tolist())
+
+        print(">> Campaign lookup indexes built.")
+
+    def build_cubes(self):
+        if not self.campaign_index:
+            self.build_indexes()
+
+        # Daily campaign cube: one row per (Date, CampaignID) with the summed metrics
+        results = self.campaign_results.copy()
+        results['Date'] = pd.to_datetime(results['Timestamp']).dt.normalize()
+        metrics = results.pivot_table(index=['Date', 'CampaignID'], columns='Metric', values='Value', aggfunc='sum', fill_value=0)
+
+        # Campaign_Results has no spend, so BudgetSpend is derived: each campaign's budget spread evenly over the days it was active.
+        # The results are a few timestamped points per campaign, not daily figures, so BudgetSpend and the result metrics
+        # only line up over a campaign's full period; rollup() therefore leaves out cost KPIs for time windows.
+        spend_rows = []
+        for campaign_id, entry in self.campaign_index.items():
+            active_days = pd.date_range(entry['StartDate'], entry['EndDate'], freq='D')
+            daily_spend = entry['Budget'] / len(active_days)
+            spend_rows.extend({'Date': day, 'CampaignID': campaign_id, 'BudgetSpend': daily_spend} for day in active_days)
+        spend = pd.DataFrame(spend_rows).set_index(['Date', 'CampaignID'])
+
+        self.daily_cube = metrics.join(spend, how='outer').reindex(columns=self.METRICS).fillna(0).sort_index()
+        self.dimension_cubes['campaign'] = self.daily_cube
+
+        # Per-dimension cubes, aggregated once from the daily campaign cube
+        for name, bridge in self.bridges.items():
+            key = self.DIMENSIONS[name]
+            cube = self.daily_cube.reset_index().merge(bridge, on='CampaignID')
+            cube[self.METRICS] = cube[self.METRICS].multiply(cube['Weight'], axis=0)
+            self.dimension_cubes[name] = cube.groupby(['Date', key])[self.METRICS].sum().sort_index()
+
+        self.build_segment_cube()
+        print(">> Campaign aggregate cubes built.")
+
+    def build_segment_cube(self):
+        # Orders attributed to a campaign: orders from a retailer running the campaign, placed while it was active
+        orders = self.orders_segmented.copy()
+        orders['Date'] = pd.to_datetime(orders['OrderDate']).dt.normalize()
+        orders['Revenue'] = orders['Price'] * orders['Quantity']
+
+        campaign_retailers = pd.DataFrame(
+            [(campaign_id, retailer_id, entry['StartDate'], entry['EndDate'])
+             for campaign_id, entry in self.campaign_index.items() for retailer_id in entry['RetailerIDs']],
+            columns=['CampaignID', 'RetailerID', 'StartDate', 'EndDate']
+        )
+        attributed = orders.merge(campaign_retailers, on='RetailerID')
+        attributed = attributed.loc[attributed['Date'].between(attributed['StartDate'], attributed['EndDate'])]
+
+        # Order lines without a review have no cluster, keep them as their own segment (-1)
+        attributed['Cluster'] = attributed['Cluster'].fillna(-1).astype(int)
+
+        # Like the bridge weights, an order line is split evenly across the campaigns it overlaps,
+        # so segment revenue summed over campaigns adds up to the attributed order lines once
+        attributed['Weight'] = 1 / attributed.groupby('OrderItemID')['OrderItemID'].transform('size')
+        attributed['OrderLines'] = attributed['Weight']
+        attributed['Revenue'] = attributed['Revenue'] * attributed['Weight']
+
+        self.segment_cube = (
+            attributed.groupby(['Date', 'CampaignID', 'Cluster'])[['OrderLines', 'Revenue']]
+            .sum()
+            .sort_index()
+        )
+
+    def slice_cube(self, cube, start=None, end=None):
+        # Cubes are sorted on Date first, so a time window is a single index slice
+        start = pd.to_datetime(start).normalize() if start is not None else None
+        end = pd.to_datetime(end).normalize() if end is not None else None
+        return cube.loc[start:end]
+
+    def add_kpis(self, rollup, cost_kpis=True):
+        # Ratios are computed after summing so they stay correct for any window
+        clicks = rollup['Clicks'].replace(0, np.nan)
+        conversions = rollup['Conversions'].replace(0, np.nan)
+        impressions = rollup['Impressions'].replace(0, np.nan)
+
+        rollup['CTR'] = rollup['Clicks'] / impressions
+        rollup['ConversionRate'] = rollup['Conversions'] / clicks
+
+        # Cost KPIs compare the derived BudgetSpend with the results, which is only meaningful over full campaign periods
+        if cost_kpis:
+            rollup['CostPerClick'] = rollup['BudgetSpend'] / clicks
+            rollup['CostPerConversion'] = rollup['BudgetSpend'] / conversions
+        return rollup
+
+    def dimension_cube(self, dimension):
+        # Precomputed cube of a dimension, building the cubes on first use
+        if dimension not in self.DIMENSIONS:
+            raise KeyError(f"Unknown dimension '{dimension}', choose from {list(self.DIMENSIONS)}")
+        if self.daily_cube is None:
+            self.build_cubes()
+        return self.dimension_cubes[dimension]
+
+    def rollup(self, dimension='campaign', start=None, end=None, ids=None):
+        # Answer a KPI query for a dimension over a time window straight from the precomputed cubes
+        cube = self.dimension_cube(dimension)
+        key = self.DIMENSIONS[dimension]
+        window = self.slice_cube(cube, start, end)
+        rollup = window.groupby(level=key).sum()
+
+        if ids is not None:
+            rollup = rollup.loc[rollup.index.intersection(ids)]
+
+        return self.add_kpis(rollup, cost_kpis=start is None and end is None)
+
+    def daily_rollup(self, dimension='campaign', start=None, end=None, ids=None):
+        # Same as rollup() but keeps the per-day breakdown
+        cube = self.dimension_cube(dimension)
+        key = self.DIMENSIONS[dimension]
+        window = self.slice_cube(cube, start, end)
+
+        if ids is not None:
+            window = window.loc[window.index.get_level_values(key).isin(ids)]
+
+        return self.add_kpis(window.copy(), cost_kpis=False)
+
+    def segment_rollup(self, start=None, end=None, campaign_ids=None):
+        # Order lines and revenue per customer segment (Cluster) attributed to each campaign
+        if self.daily_cube is None:
+            self.build_cubes()
+
+        window = self.slice_cube(self.segment_cube, start, end)
+
+        if campaign_ids is not None:
+            window = window.loc[window.index.get_level_values('CampaignID').isin(campaign_ids)]
+
+        return window.groupby(level=['CampaignID', 'Cluster']).sum().unstack(fill_value=0)
+
+    def save_output(self):
+        # Save the full-period campaign KPIs together with the revenue attributed to each segment
+        performance = self.rollup('campaign')
+        segment_revenue = self.segment_rollup()['Revenue']
+        segment_revenue.columns = [f'Revenue_Cluster_{cluster}' for cluster in segment_revenue.columns]
+
+        performance = performance.join(segment_revenue, how='left').fillna({col: 0 for col in segment_revenue.columns})
+        save_csv_atomic(performance.reset_index(), 'data/Campaign_Performance.csv')
+        print("\n>> Campaign_Performance.csv successfully created!")
+
+if __name__ == "__main__":
+    # Instantiate the class
+    campaign_rollup = CampaignRollup()
+
+    # Step 1: Build the lookup indexes over the bridge tables
+    campaign_rollup.build_indexes()
+
+    # Step 2: Precompute the aggregate cubes
+    campaign_rollup.build_cubes()
+
+    # Step 3: Save the campaign performance summary
+    campaign_rollup.save_output()
@@ -0,0 +1,336 @@
+import hashlib
+import json
+import os
+import sys
+
+import pandas as pd
+import numpy as np
+
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+
+from io_utils import atomic_write, save_csv_atomic
+from similarity_index import SimilarityIndex
+
+class CustomerFeatureStore:
+    # Aggregates kept per customer; each kind merges differently when a new batch comes in
+    SUM_COLUMNS = [
+        'Orders', 'OrderLines', 'Spend', 'Quantity',
+        'SentimentSum', 'SentimentCount', 'RatingSum', 'RatingCount',
+        'Events', 'DwellTimeSum'
+    ]
+    MIN_COLUMNS = ['FirstOrderDate']
+    MAX_COLUMNS = ['LastOrderDate', 'LastEventDate']
+    DATE_COLUMNS = ['FirstOrderDate', 'LastOrderDate', 'LastEventDate']
+
+    # New customers are buffered and appended to the state in one go once the buffer reaches this share of the state,
+    # so appending (which copies the state) stays amortized O(batch)
+    PENDING_RATIO = 0.1
+
+    def __init__(self, state_filepath='data/Customer_Feature_State.csv'):
+        self.state_filepath = state_filepath
+        self.metadata_filepath = os.path.splitext(state_filepath)[0] + '.json'
+        self.reset()
+
+    def reset(self):
+        # One row of mergeable aggregates per customer, indexed by CustomerID
+        self.state = self.empty_state()
+        self.pending = self.empty_state()
+
+        # Which rows have already been merged: ID watermarks for the source files and the orders counted so far
+        self.last_order_item_id = 0
+        self.last_behavior_id = 0
+        self.seen_order_ids = set()
+
+        # Fingerprints of the source file rows up to the watermarks, to notice when merged rows were regenerated
+        self.orders_fingerprint = None
+        self.behavior_fingerprint = None
+
+        # Empty initialization to be filled out by compute_features() and cluster_customers()
+        self.features = None
+        self.customer_vectors = None
+        self.similarity_index = None
+
+    def empty_state(self):
+        state = self.enforce_types(pd.DataFrame(columns=self.SUM_COLUMNS + self.MIN_COLUMNS + self.MAX_COLUMNS))
+        state.index.name = 'CustomerID'
+        return state
+
+    def enforce_types(self, df):
+        # Dates stay datetimes and counters floats, even for columns a batch did not provide
+        for col in df.columns:
+            df[col] = pd.to_datetime(df[col]).astype('datetime64[ns]') if col in self.DATE_COLUMNS else df[col].astype(float)
+        return df
+
+    def action_columns(self):
+        # Action type counts are added as new action types show up in the behavioral data
+        return [col for col in self.state.columns if col.startswith('Action_')]
+
+    def aggregate_orders(self, orders):
+        # Summarize a batch of order lines (Orders_Master / Orders_Segmented rows) per customer
+        orders = orders.copy()
+        orders['Revenue'] = orders['Price'] * orders['Quantity']
+        orders['OrderDate'] = pd.to_datetime(orders['OrderDate'])
+
+        # An order whose lines are split across batches is only counted in the first batch it shows up in
+        orders['NewOrderID'] = orders['OrderID'].where(~orders['OrderID'].isin(self.seen_order_ids))
+
+        # Sentiment is only present once TextProcessing has run, ratings once reviews are generated
+        orders['compound'] = orders['compound'] if 'compound' in orders.columns else np.nan
+        orders['Ratings'] = pd.to_numeric(orders['Ratings'], errors='coerce') if 'Ratings' in orders.columns else np.nan
+
+        return orders.groupby('CustomerID').agg(
+            Orders=('NewOrderID', 'nunique'),
+            OrderLines=('OrderID', 'size'),
+            Spend=('Revenue', 'sum'),
+            Quantity=('Quantity', 'sum'),
+            SentimentSum=('compound', 'sum'),
+            SentimentCount=('compound', 'count'),
+            RatingSum=('Ratings', 'sum'),
+            RatingCount=('Ratings', 'count'),
+            FirstOrderDate=('OrderDate', 'min'),
+            LastOrderDate=('OrderDate', 'max')
+        )
+
+    def aggregate_behavior(self, behavior):
+        # Summarize a batch of Behavioral_Data events per customer
+        behavior = behavior.copy()
+        behavior['Timestamp'] = pd.to_datetime(behavior['Timestamp'])
+
+        aggregates = behavior.groupby('CustomerID').agg(
+            Events=('BehaviorID', 'size'),
+            DwellTimeSum=('DwellTimeSeconds', 'sum'),
+            LastEventDate=('Timestamp', 'max')
+        )
+        action_counts = pd.crosstab(behavior['CustomerID'], behavior['ActionType']).add_prefix('Action_')
+        return aggregates.join(action_counts)
+
+    def merge_rows(self, target, batch, rows):
+        # Merge the batch aggregates of the given customers into rows that already exist in target (in place)
+        sum_cols = [col for col in batch.columns if col in self.SUM_COLUMNS or col.startswith('Action_')]
+        target.loc[rows, sum_cols] = target.loc[rows, sum_cols].add(batch.loc[rows, sum_cols], fill_value=0)
+        for col in [col for col in self.MIN_COLUMNS if col in batch.columns]:
+            target.loc[rows, col] = pd.concat([target.loc[rows, col], batch.loc[rows, col]], axis=1).min(axis=1)
+        for col in [col for col in self.MAX_COLUMNS if col in batch.columns]:
+            target.loc[rows, col] = pd.concat([target.loc[rows, col], batch.loc[rows, col]], axis=1).max(axis=1)
+
+    def merge_aggregates(self, batch):
+        # Fold a batch of per-customer aggregates into the state, touching only the customers in the batch
+        batch = self.enforce_types(batch)
+        for col in batch.columns:
+            if col not in self.state.columns:
+                # Only happens when a new action type shows up
+                self.state[col] = 0.0
+                self.pending[col] = 0.0
+
+        in_state = batch.index.intersection(self.state.index)
+        in_pending = batch.index.intersection(self.pending.index)
+        new = batch.index.difference(self.state.index).difference(self.pending.index)
+
+        if len(in_state) > 0:
+            self.merge_rows(self.state, batch, in_state)
+        if len(in_pending) > 0:
+            self.merge_rows(self.pending, batch, in_pending)
+
+        if len(new) > 0:
+            # Counters start at zero for customers seen in only one of the sources
+            new_rows = self.enforce_types(batch.loc[new].reindex(columns=self.state.columns))
+            counter_cols = self.SUM_COLUMNS + self.action_columns()
+            new_rows[counter_cols] = new_rows[counter_cols].fillna(0)
+            self.pending = pd.concat([self.pending, new_rows]) if len(self.pending) > 0 else new_rows
+
+        if len(self.pending) >= self.PENDING_RATIO * len(self.state):
+            self.consolidate()
+
+    def consolidate(self):
+        # Append the buffered new customers to the state in one go
+        if len(self.pending) > 0:
+            self.state = pd.concat([self.state, self.pending]) if len(self.state) > 0 else self.pending
+            self.state.index.name = 'CustomerID'
+            self.pending = self.empty_state().reindex(columns=self.state.columns)
+
+    def update(self, orders=None, behavior=None):
+        # Incrementally update the store with new order lines and/or behavioral events
+        if orders is not None and len(orders) > 0:
+            self.merge_aggregates(self.aggregate_orders(orders))
+            self.seen_order_ids.update(orders['OrderID'].tolist())
+            self.last_order_item_id = max(self.last_order_item_id, int(orders['OrderItemID'].max()))
+        if behavior is not None and len(behavior) > 0:
+            self.merge_aggregates(self.aggregate_behavior(behavior))
+            self.last_behavior_id = max(self.last_behavior_id, int(behavior['BehaviorID'].max()))
+
+        # Batches passed in directly are not tied to the source files anymore
+        self.orders_fingerprint = None
+        self.behavior_fingerprint = None
+
+        # Derived features are stale once the aggregates change
+        self.features = None
+
+    def fingerprint(self, df, id_column, last_id):
+        # Hash of the rows up to the watermark, so appending new rows keeps it but regenerating old ones changes it
+        merged = df.loc[df[id_column] <= last_id].sort_values(id_column)
+        return hashlib.sha256(pd.util.hash_pandas_object(merged, index=False).values.tobytes()).hexdigest()
+
+    def fingerprint_files(self, orders, behavior):
+        self.orders_fingerprint = self.fingerprint(orders, 'OrderItemID', self.last_order_item_id)
+        self.behavior_fingerprint = self.fingerprint(behavior, 'BehaviorID', self.last_behavior_id)
+
+    def build_from_files(self, orders_filepath='data/Orders_Segmented.csv', behavior_filepath='data/Behavioral_Data.csv'):
+        # Full build: start from an empty state and treat each file as a single batch
+        orders = pd.read_csv(orders_filepath)
+        behavior = pd.read_csv(behavior_filepath)
+
+        self.reset()
+        self.update(orders=orders, behavior=behavior)
+        self.consolidate()
+        self.fingerprint_files(orders, behavior)
+        print(f">> Customer feature store built for {len(self.state)} customers.")
+
+    def refresh_from_files(self, orders_filepath='data/Orders_Segmented.csv', behavior_filepath='data/Behavioral_Data.csv', rebuild=False):
+        # Merge only the order lines and events added since the saved state. Everything is rebuilt when asked, or when
+        # the rows already merged changed in the files (e.g. the pipeline regenerated reviews, sentiment or prices)
+        if rebuild or not self.load_state():
+            self.build_from_files(orders_filepath, behavior_filepath)
+            return
+
+        orders = pd.read_csv(orders_filepath)
+        behavior = pd.read_csv(behavior_filepath)
+        if (self.fingerprint(orders, 'OrderItemID', self.last_order_item_id) != self.orders_fingerprint
+                or self.fingerprint(behavior, 'BehaviorID', self.last_behavior_id) != self.behavior_fingerprint):
+            print(">> Source data changed since the saved state, rebuilding the customer features.")
+            self.build_from_files(orders_filepath, behavior_filepath)
+            return
+
+        new_orders = orders.loc[orders['OrderItemID'] > self.last_order_item_id]
+        new_behavior = behavior.loc[behavior['BehaviorID'] > self.last_behavior_id]
+
+        self.update(orders=new_orders, behavior=new_behavior)
+        self.consolidate()
+        self.fingerprint_files(orders, behavior)
+        print(f">> Merged {len(new_orders)} new order lines and {len(new_behavior)} new events"
+              f" ({len(self.state)} customers).")
+
+    def load_state(self):
+        # Restore the aggregates saved by a previous run so new batches can be merged into them
+        if not (os.path.exists(self.state_filepath) and os.path.exists(self.metadata_filepath)):
+            return False
+
+        self.reset()
+        self.state = self.enforce_types(pd.read_csv(self.state_filepath, index_col='CustomerID'))
+        self.pending = self.empty_state().reindex(columns=self.state.columns)
+        with open(self.metadata_filepath) as f:
+            metadata = json.load(f)
+        self.last_order_item_id = metadata['LastOrderItemID']
+        self.last_behavior_id = metadata['LastBehaviorID']
+        self.seen_order_ids = set(metadata['SeenOrderIDs'])
+        self.orders_fingerprint = metadata.get('OrdersFingerprint')
+        self.behavior_fingerprint = metadata.get('BehaviorFingerprint')
+
+        print(f">> Loaded customer feature state for {len(self.state)} customers.")
+        return True
+
+    def save_state(self):
+        self.consolidate()
+        metadata = {
+            'LastOrderItemID': self.last_order_item_id,
+            'LastBehaviorID': self.last_behavior_id,
+            'SeenOrderIDs': sorted(int(order_id) for order_id in self.seen_order_ids),
+            'OrdersFingerprint': self.orders_fingerprint,
+            'BehaviorFingerprint': self.behavior_fingerprint
+        }
+        save_csv_atomic(self.state.reset_index(), self.state_filepath)
+        atomic_write(self.metadata_filepath, lambda tmp_file: json.dump(metadata, tmp_file))
+        print(f">> {os.path.basename(self.state_filepath)} saved!")
+
+    def compute_features(self, reference_date=None):
+        # Turn the aggregates into customer-level features (RFM, dwell time, action counts, sentiment)
+        self.consolidate()
+        state = self.state
+        if reference_date is None:
+            reference_date = max(state['LastOrderDate'].max(), state['LastEventDate'].max())
+        reference_date = pd.to_datetime(reference_date)
+
+        orders = state['Orders'].replace(0, np.nan)
+        features = pd.DataFrame(index=state.index)
+        features['Recency'] = (reference_date - pd.to_datetime(state['LastOrderDate'])).dt.days
+        features['Frequency'] = state['Orders']
+        features['Monetary'] = state['Spend']
+        features['AvgOrderValue'] = state['Spend'] / orders
+        features['Events'] = state['Events']
+        features['AvgDwellTime'] = state['DwellTimeSum'] / state['Events'].replace(0, np.nan)
+        for col in self.action_columns():
+            features[col] = state[col]
+        features['AvgSentiment'] = state['SentimentSum'] / state['SentimentCount'].replace(0, np.nan)
+        features['AvgRating'] = state['RatingSum'] / state['RatingCount'].replace(0, np.nan)
+
+        # RFM scores from 1 (worst) to 5 (best) for customers with orders, 0 for customers without any.
+        # Scores come from fixed bins over the percentile rank, and tied values share their lowest rank,
+        # so customers with the same value always get the same score
+        buyers = features['Frequency'] > 0
+        for col, ascending in [('Recency', False), ('Frequency', True), ('Monetary', True)]:
+            percentiles = features.loc[buyers, col].rank(method='min', ascending=ascending, pct=True)
+            features[f'{col[0]}Score'] = 0
+            features.loc[buyers, f'{col[0]}Score'] = np.ceil(percentiles * 5).clip(1, 5).astype(int)
+        features['RFMScore'] = features['RScore'] + features['FScore'] + features['MScore']
+
+        self.features = features
+        print(">> Customer features computed.")
+        return features
+
+    def cluster_customers(self, n_clusters=5):
+        # Cluster customers on their compact features instead of on the raw order/behavior rows
+        if self.features is None:
+            self.compute_features()
+
+        model_input = self.features[
+            ['Recency', 'Frequency', 'Monetary', 'Events', 'AvgDwellTime', 'AvgSentiment'] + self.action_columns()
+        ].copy()
+
+        # Customers without orders are treated as the least recent, missing averages as neutral
+        model_input['Recency'] = model_input['Recency'].fillna(model_input['Recency'].max() + 1).fillna(0)
+        model_input[['Frequency', 'Monetary']] = np.log1p(model_input[['Frequency', 'Monetary']])
+        model_input = model_input.fillna(0)
+
+        scaled = StandardScaler().fit_transform(model_input)
+        self.customer_vectors = scaled
+
+        # Initialize K-Means clustering
+        kmeans = KMeans(n_init=10, n_clusters=n_clusters, random_state=42)
+        self.features['CustomerCluster'] = kmeans.fit_predict(scaled)
+        print(">> Customer K-Means clustering completed.")
+
+    def build_similarity_index(self, filepath='data/Customer_Index.pkl'):
+        # Index the customers on the same scaled features used for clustering
+        if self.customer_vectors is None:
+            self.cluster_customers()
+
+        self.similarity_index = SimilarityIndex()
+        self.similarity_index.build(self.customer_vectors, self.features.index.values)
+        self.similarity_index.save(filepath)
+
+    def save_output(self):
+        # Save the customer features and their segments
+        save_csv_atomic(self.features.reset_index(), 'data/Customer_Segments.csv')
+        print("\n>> Customer_Segments.csv successfully created!")
+
+if __name__ == "__main__":
+    # Instantiate the class
+    feature_store = CustomerFeatureStore()
+
+    # Step 1: Merge new order and behavioral data into the saved aggregates (python customer_features.py --rebuild to start over)
+    feature_store.refresh_from_files(rebuild='--rebuild' in sys.argv)
+
+    # Step 2: Save the aggregates so later batches can be merged incrementally
+    feature_store.save_state()
+
+    # Step 3: Compute the customer-level features
+    feature_store.compute_features()
+
+    # Step 4: Cluster the customers
+    feature_store.cluster_customers()
+
+    # Step 5: Build the customer similarity index
+    feature_store.build_similarity_index()
+
+    # Step 6: Save the output to a file
+    feature_store.save_output()
@@ -5,6 +5,8 @@ import phonenumbers
 from decimal import Decimal
 from tqdm import tqdm
 
+from io_utils import save_csv_atomic
+
 class DataClean:
     def __init__(self):
         # Load all necessary dataframes during initialization
@@ -242,11 +244,11 @@ class DataClean:
         for df_name in df_related_names:
             # Save each related dataframe
             df = getattr(self, df_name)
-            df.to_csv(f'data/{df_name.title()}.csv', index=False)
+            save_csv_atomic(df, f'data/{df_name.title()}.csv')
             print(f">> {df_name.title()}.csv generated!")
 
         # Save the main dataframe
-        df_main.to_csv(f'data/{data_name.title()}.csv', index=False)
+        save_csv_atomic(df_main, f'data/{data_name.title()}.csv')
         print(f">> {data_name.title()}.csv generated!")
 
     # Additional checks or logic (from your original file) can go here
@@ -1,6 +1,8 @@
 import pandas as pd
 import random
 
+from io_utils import save_csv_atomic
+
 class GenerateReviews:
     def __init__(self):
         # initializing the dataframe
@@ -60,7 +62,7 @@ class GenerateReviews:
         self.update_orders()
 
     def update_orders(self):
-        self.data.to_csv('data/Orders_Master.csv', index=False)
+        save_csv_atomic(self.data, 'data/Orders_Master.csv')
         print('>> Generated reviews and ratings added to Orders_Master.csv!')
 
 if __name__ == '__main__':
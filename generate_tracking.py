@@ -1,5 +1,7 @@
 import pandas as pd
 
+from io_utils import save_csv_atomic
+
 class GenerateTracking:
     def __init__(self):
         self.orders_master = pd.read_csv('data/Orders_Master.csv')
@@ -32,7 +34,7 @@ class GenerateTracking:
         self.update_tracking(merged_df)
 
     def update_tracking(self, df):
-        df.to_csv('data/Tracking.csv', index=False)
+        save_csv_atomic(df, 'data/Tracking.csv')
         print('>> Tracking.csv updated!')
 
 if __name__ == '__main__':
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 
+from io_utils import save_csv_atomic
+
 class GenerateTransactions:
     def __init__(self):
         # Initialize dataframes
@@ -54,7 +56,7 @@ class GenerateTransactions:
         complete_transactions = pd.concat([self.transactions, synthetic_transactions_df], ignore_index=True)
 
         # Save the result to a CSV file
-        complete_transactions.to_csv('data/Transactions.csv', index=False)
+        save_csv_atomic(complete_transactions, 'data/Transactions.csv')
         print(f'>> Transactions.csv successfully updated!')
 
 if __name__ == "__main__":
@@ -0,0 +1,37 @@
+import os
+import pickle
+import tempfile
+
+def file_mode(filepath):
+    # Permissions of the file being replaced, or the default for new files under the current umask
+    if os.path.exists(filepath):
+        return os.stat(filepath).st_mode & 0o777
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def atomic_write(filepath, write_fn, mode='w'):
+    # Write to a temporary file in the same folder first, then swap it into place in one step.
+    # Stages running concurrently will only ever see the previous or the new version of a file, never a half-written one.
+    folder = os.path.dirname(os.path.abspath(filepath))
+
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.' + os.path.basename(filepath) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, **({'newline': ''} if 'b' not in mode else {})) as tmp_file:
+            write_fn(tmp_file)
+
+        # mkstemp creates the file readable by the owner only; keep the permissions a plain open() would give
+        os.chmod(tmp_path, file_mode(filepath))
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        # Clean up the partial file so the data folder is left untouched
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def save_csv_atomic(df, filepath, **kwargs):
+    kwargs.setdefault('index', False)
+    atomic_write(filepath, lambda tmp_file: df.to_csv(tmp_file, **kwargs))
+
+def save_pickle_atomic(obj, filepath):
+    atomic_write(filepath, lambda tmp_file: pickle.dump(obj, tmp_file), mode='wb')
@@ -1,52 +1,111 @@
+import sys
+from functools import partial
+
 from data_clean import DataClean
 from generate_transactions import GenerateTransactions
 from generate_reviews import GenerateReviews
 from generate_tracking import GenerateTracking
 from nlp_segmentation import TextProcessing
 from heatmap_generator import HeatmapGenerator
+from campaign_rollup import CampaignRollup
+from customer_features import CustomerFeatureStore
+from pipeline_scheduler import PipelineScheduler
+
+# Each stage is a module-level function so it can be sent to a worker process
 
-def main():
-    # Step 1: Run DataClean
-    print("\n>>> Running DataClean...\n")
+def run_data_clean():
     cleaner = DataClean()
     cleaner.clean_customer_behavior()
     cleaner.clean_orders_master()
 
-    # Step 2: Run GenerateTransactions
-    print("\n>>> Running GenerateTransactions...")
+def run_generate_transactions():
     transaction_generator = GenerateTransactions()
     orders_without_transactions = transaction_generator.identify_missing_transactions()  # Identify missing transactions
     synthetic_transactions_df = transaction_generator.generate_synthetic_transactions(orders_without_transactions)  # Generate synthetic transactions
     transaction_generator.save_complete_transactions(synthetic_transactions_df, 'data/Complete_Transactions.csv')  # Save the complete transactions
 
-    # Step 3: Run GenerateReviews
-    print("\n>>> Running GenerateReviews...")
+def run_generate_reviews():
     review_generator = GenerateReviews()
     review_generator.add_reviews()  # Generate reviews
 
-    # Step 4: Run GenerateTracking
-    print("\n>>> Running GenerateTracking...")
+def run_generate_tracking():
     tracking_generator = GenerateTracking()
     tracking_generator.generate_tracking()  # Generate tracking information
 
-    # Step 5: Run TextProcessing
-    print("\n>>> Running TextProcessing...")
+def run_text_processing(model_selection=False):
     text_processor = TextProcessing()
     text_processor.download_nltk_data()  # Ensure all NLTK data is downloaded
     text_processor.check_reviews()  # Ensure reviews are generated
     text_processor.apply_preprocessing()  # Preprocess reviews
     text_processor.extract_features()  # Extract TF-IDF features
     text_processor.sentiment_analysis()  # Perform sentiment analysis
-    text_processor.topic_modeling()  # Perform topic modeling using LDA
-    text_processor.clustering()  # Perform KMeans clustering
+
+    n_clusters, n_topics = 5, 5
+    if model_selection:
+        best_n_clusters, best_n_topics = text_processor.model_selection()  # Sweep cluster and topic counts concurrently
+        n_clusters, n_topics = best_n_clusters or n_clusters, best_n_topics or n_topics
+
+    text_processor.topic_modeling(n_components=n_topics)  # Perform topic modeling using LDA
+    text_processor.clustering(n_clusters=n_clusters)  # Perform KMeans clustering
+    text_processor.build_similarity_index()  # Build the review similarity index
     text_processor.save_output()  # Save the output
 
-    # Step 6: Run HeatmapGenerator
-    print("\n>>> Running HeatmapGenerator...")
+def run_heatmap_generator():
     heatmap_generator = HeatmapGenerator()
     heatmap_generator.preprocess_data()  # Preprocess data
     heatmap_generator.geocode_locations()  # Geocode locations
     heatmap_generator.create_heatmaps()  # Generate and save heatmaps
 
+def run_campaign_rollup():
+    campaign_rollup = CampaignRollup()
+    campaign_rollup.build_indexes()  # Index the campaign bridge tables
+    campaign_rollup.build_cubes()  # Precompute the per-campaign/channel/audience/store daily cubes
+    campaign_rollup.save_output()  # Save campaign KPIs with segment revenue
+
+def run_customer_segmentation(rebuild_features=False):
+    feature_store = CustomerFeatureStore()
+    feature_store.refresh_from_files(rebuild=rebuild_features)  # Merge new orders and behavioral data into the saved aggregates
+    feature_store.save_state()  # Save the aggregates for incremental updates
+    feature_store.compute_features()  # Compute RFM, dwell time, action and sentiment features
+    feature_store.cluster_customers()  # Perform KMeans clustering on the customer features
+    feature_store.build_similarity_index()  # Build the customer similarity index
+    feature_store.save_output()  # Save the output
+
+# Dependencies between stages, based on the files each stage reads:
+#  - GenerateTransactions reads Orders.csv (rewritten by DataClean) and Transactions.csv
+#  - GenerateReviews reads Orders_Master.csv (created by DataClean)
+#  - GenerateTracking only needs OrderID/Status/OrderDate from Orders_Master.csv, which the reviews do not change
+#  - TextProcessing needs the reviews, HeatmapGenerator and CampaignRollup need the clusters from TextProcessing
+#  - CustomerSegmentation needs the sentiment scores from TextProcessing
+PIPELINE_STAGES = {
+    'DataClean': {'run': run_data_clean, 'depends_on': []},
+    'GenerateTransactions': {'run': run_generate_transactions, 'depends_on': ['DataClean']},
+    'GenerateReviews': {'run': run_generate_reviews, 'depends_on': ['DataClean']},
+    'GenerateTracking': {'run': run_generate_tracking, 'depends_on': ['DataClean']},
+    'TextProcessing': {'run': run_text_processing, 'depends_on': ['GenerateReviews']},
+    'HeatmapGenerator': {'run': run_heatmap_generator, 'depends_on': ['TextProcessing']},
+    'CampaignRollup': {'run': run_campaign_rollup, 'depends_on': ['TextProcessing']},
+    'CustomerSegmentation': {'run': run_customer_segmentation, 'depends_on': ['TextProcessing']},
+}
+
+def main(sequential=False, max_workers=None, model_selection=False, rebuild_features=False):
+    stages = dict(PIPELINE_STAGES)
+    if model_selection:
+        stages['TextProcessing'] = {'run': partial(run_text_processing, model_selection=True), 'depends_on': ['GenerateReviews']}
+    if rebuild_features:
+        stages['CustomerSegmentation'] = {'run': partial(run_customer_segmentation, rebuild_features=True), 'depends_on': ['TextProcessing']}
+
+    scheduler = PipelineScheduler(stages, max_workers=max_workers)
+
+    # Independent stages run concurrently in a process pool unless a sequential run is requested
+    if sequential:
+        scheduler.run_sequential()
+    else:
+        scheduler.run()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(
+        sequential='--sequential' in sys.argv,
+        model_selection='--model-selection' in sys.argv,
+        rebuild_features='--rebuild-features' in sys.argv
+    )
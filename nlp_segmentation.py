@@ -1,5 +1,9 @@
 import pandas as pd
+import numpy as np
 import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import nltk
 from nltk.corpus import stopwords
@@ -10,12 +14,71 @@ from nltk.sentiment.vader import SentimentIntensityAnalyzer
 from sklearn.decomposition import LatentDirichletAllocation
 from sklearn.cluster import KMeans
 from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import silhouette_score
+from threadpoolctl import threadpool_limits
+
+from similarity_index import SimilarityIndex
+
+from io_utils import save_csv_atomic
 
 import warnings
 
 # Suppress RuntimeWarnings due to an inconsistency with packages loaded from incompatible origins, no workaround works
 warnings.filterwarnings("ignore", category=RuntimeWarning)
 
+# TF-IDF matrices shared by the model selection workers, sent once per worker process instead of once per candidate
+WORKER_TFIDF_MATRIX = None
+WORKER_TRAIN_MATRIX = None
+WORKER_HOLDOUT_MATRIX = None
+
+def init_model_selection_worker(tfidf_matrix, train_matrix, holdout_matrix):
+    global WORKER_TFIDF_MATRIX, WORKER_TRAIN_MATRIX, WORKER_HOLDOUT_MATRIX
+
+    # The pool already runs one worker per core, so each worker keeps KMeans/BLAS to a single native thread
+    # instead of starting a thread per core itself
+    threadpool_limits(limits=1)
+
+    WORKER_TFIDF_MATRIX = tfidf_matrix
+    WORKER_TRAIN_MATRIX = train_matrix
+    WORKER_HOLDOUT_MATRIX = holdout_matrix
+
+def sampled_silhouette(tfidf_matrix, labels, sample_size, random_state=42):
+    # Silhouette on a random sample of rows instead of the full O(n^2) pairwise distances
+    try:
+        return silhouette_score(tfidf_matrix, labels, sample_size=min(sample_size, tfidf_matrix.shape[0]), random_state=random_state)
+    except ValueError:
+        # Fewer than two distinct labels ended up in the sample
+        return np.nan
+
+def evaluate_candidate(model, n, n_init, sample_size):
+    # Fit and score a single K-Means / LDA candidate on the shared TF-IDF matrix
+    tfidf_matrix = WORKER_TFIDF_MATRIX
+
+    start = time.perf_counter()
+    if model == 'KMeans':
+        estimator = KMeans(n_init=n_init, n_clusters=n, random_state=42)
+        labels = estimator.fit_predict(tfidf_matrix)
+    else:
+        # LDA is fit on the training rows only, so its perplexity can be measured on rows it has not seen
+        estimator = LatentDirichletAllocation(n_components=n, random_state=42)
+        estimator.fit(WORKER_TRAIN_MATRIX)
+        labels = estimator.transform(tfidf_matrix).argmax(axis=1)  # Dominant topic per review
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    silhouette = sampled_silhouette(tfidf_matrix, labels, sample_size)
+    perplexity = estimator.perplexity(WORKER_HOLDOUT_MATRIX) if model == 'LDA' else np.nan
+    score_seconds = time.perf_counter() - start
+
+    return {
+        'Model': model,
+        'N': n,
+        'Silhouette': silhouette,
+        'HeldOutPerplexity': perplexity,
+        'FitSeconds': fit_seconds,
+        'ScoreSeconds': score_seconds
+    }
+
 class TextProcessing:
     def __init__(self):
         # Load the data
@@ -26,6 +89,10 @@ class TextProcessing:
         self.stop_words = set(stopwords.words('english'))
         self.tfidf_matrix = None
         self.tfidf_df = None
+        self.review_ids = None
+        self.topic_matrix = None
+        self.similarity_index = None
+        self.model_selection_report = None
 
     def check_reviews(self):
         # If the "Reviews" column doesn't exist, run generate_reviews and reload the data
@@ -70,7 +137,11 @@ class TextProcessing:
         tfidf = TfidfVectorizer(max_features=1000)  # Use the top 1000 words
         
         # Transform the cleaned reviews into TF-IDF matrix
-        self.tfidf_matrix = tfidf.fit_transform(self.orders_master['CleanedReviews'].dropna())
+        reviews = self.orders_master['CleanedReviews'].dropna()
+        self.tfidf_matrix = tfidf.fit_transform(reviews)
+
+        # Keep track of which order line each TF-IDF row belongs to
+        self.review_ids = self.orders_master.loc[reviews.index, 'OrderItemID'].values
 
         # Convert to DataFrame for easier inspection
         self.tfidf_df = pd.DataFrame(self.tfidf_matrix.toarray(), columns=tfidf.get_feature_names_out())
@@ -96,17 +167,17 @@ class TextProcessing:
         self.orders_master = pd.concat([self.orders_master, sentiment_scores], axis=1)
         print(">> Sentiment analysis completed.")
 
-    def topic_modeling(self):
-        # Initialize LDA with 5 topics
-        lda = LatentDirichletAllocation(n_components=5, random_state=42)
+    def topic_modeling(self, n_components=5):
+        # Initialize LDA with 5 topics by default
+        lda = LatentDirichletAllocation(n_components=n_components, random_state=42)
         
-        # Fit the LDA model on the TF-IDF matrix
-        lda.fit(self.tfidf_matrix)
+        # Fit the LDA model on the TF-IDF matrix and keep each review's topic distribution
+        self.topic_matrix = lda.fit_transform(self.tfidf_matrix)
         print(">> LDA topic modeling completed.")
 
-    def clustering(self):
+    def clustering(self, n_clusters=5, n_init=10):
         # Initialize K-Means clustering
-        kmeans = KMeans(n_init=10, n_clusters=5, random_state=42)
+        kmeans = KMeans(n_init=n_init, n_clusters=n_clusters, random_state=42)
 
         # Filter rows where 'cleaned_reviews' is not NaN
         filtered_data = self.orders_master.dropna(subset=['CleanedReviews']).copy()
@@ -121,9 +192,66 @@ class TextProcessing:
         self.orders_master = self.orders_master.merge(filtered_data[['Cluster']], left_index=True, right_index=True, how='left')
         print(">> K-Means clustering completed.")
 
+    def pick_best(self, results, column, lowest=False):
+        # Best candidate for a score, or None when it sits at either end of the range that was swept:
+        # a score that keeps improving towards the edge points outside the range, not at a real optimum
+        results = results.dropna(subset=[column]).sort_values('N')
+        if len(results) < 3:
+            return None
+
+        best = results[column].idxmin() if lowest else results[column].idxmax()
+        if best in (results.index[0], results.index[-1]):
+            print(f" > {column} is best at the edge of the range (N={int(results.loc[best, 'N'])}), no value selected.")
+            return None
+        return int(results.loc[best, 'N'])
+
+    def model_selection(self, k_values=range(2, 11), topic_values=range(2, 11), n_init=10, sample_size=1000,
+                        holdout_fraction=0.2, max_workers=None):
+        # Evaluate K-Means cluster counts and LDA topic counts concurrently on the already fitted TF-IDF matrix
+        candidates = [('KMeans', k) for k in k_values] + [('LDA', n) for n in topic_values]
+
+        # Hold out a share of the reviews to measure LDA perplexity on documents the model was not trained on
+        shuffled = np.random.default_rng(42).permutation(self.tfidf_matrix.shape[0])
+        n_holdout = max(1, int(holdout_fraction * len(shuffled)))
+        holdout_matrix = self.tfidf_matrix[shuffled[:n_holdout]]
+        train_matrix = self.tfidf_matrix[shuffled[n_holdout:]]
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=init_model_selection_worker,
+            initargs=(self.tfidf_matrix, train_matrix, holdout_matrix)
+        ) as executor:
+            futures = [executor.submit(evaluate_candidate, model, n, n_init, sample_size) for model, n in candidates]
+            results = [future.result() for future in futures]
+        total_seconds = time.perf_counter() - start
+
+        self.model_selection_report = pd.DataFrame(results)
+        print(self.model_selection_report.to_string(index=False))
+        print(f">> Model selection over {len(candidates)} candidates completed in {total_seconds:.1f}s.")
+
+        # Highest sampled silhouette for K-Means, lowest held-out perplexity for LDA (None keeps the defaults)
+        kmeans_results = self.model_selection_report.loc[self.model_selection_report['Model'] == 'KMeans']
+        lda_results = self.model_selection_report.loc[self.model_selection_report['Model'] == 'LDA']
+        best_n_clusters = self.pick_best(kmeans_results, 'Silhouette')
+        best_n_topics = self.pick_best(lda_results, 'HeldOutPerplexity', lowest=True)
+        print(f">> Selected n_clusters={best_n_clusters}, n_topics={best_n_topics}")
+
+        save_csv_atomic(self.model_selection_report, 'data/Model_Selection.csv')
+        print(">> Model_Selection.csv saved!")
+        return best_n_clusters, best_n_topics
+
+    def build_similarity_index(self, use_topics=False, exact=True, filepath='data/Review_Index.pkl'):
+        # Index the reviews for nearest-neighbour queries, on their TF-IDF vectors or LDA topic vectors
+        vectors = self.topic_matrix if use_topics else self.tfidf_matrix
+
+        # At the size of the bundled reviews (~1,800), exact search is as fast as probing the index, so it is the default
+        self.similarity_index = SimilarityIndex(exact=exact)
+        self.similarity_index.build(vectors, self.review_ids)
+        self.similarity_index.save(filepath)
+
     def save_output(self):
         # Save the result to a CSV file
-        self.orders_master.to_csv('data/Orders_Segmented.csv', index=False)
+        save_csv_atomic(self.orders_master, 'data/Orders_Segmented.csv')
         print("\n>> Orders_Segmented.csv successfully created!")
 
 if __name__ == "__main__":
@@ -145,11 +273,20 @@ if __name__ == "__main__":
     # Step 5: Perform sentiment analysis
     text_processor.sentiment_analysis()
 
+    # Optional: pick the number of clusters and topics with a concurrent sweep (python nlp_segmentation.py --model-selection)
+    n_clusters, n_topics = 5, 5
+    if '--model-selection' in sys.argv:
+        best_n_clusters, best_n_topics = text_processor.model_selection()
+        n_clusters, n_topics = best_n_clusters or n_clusters, best_n_topics or n_topics
+
     # Step 6: Perform topic modeling using LDA
-    text_processor.topic_modeling()
+    text_processor.topic_modeling(n_components=n_topics)
 
     # Step 7: Perform K-Means clustering
-    text_processor.clustering()
+    text_processor.clustering(n_clusters=n_clusters)
+
+    # Step 8: Build the review similarity index
+    text_processor.build_similarity_index()
 
-    # Step 8: Save the output to a file
+    # Step 9: Save the output to a file
     text_processor.save_output()
\ No newline at end of file
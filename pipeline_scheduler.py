@@ -0,0 +1,94 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+def timed_stage(run):
+    # Runs inside the worker, so the reported time excludes the time the stage spent queued in the pool
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+class PipelineScheduler:
+    def __init__(self, stages, max_workers=None):
+        # stages maps each stage name to {'run': <module-level function>, 'depends_on': [<stage names>]}
+        self.stages = stages
+        self.max_workers = max_workers
+        self.timings = {}
+
+        self.validate_stages()
+
+    def validate_stages(self):
+        # Every dependency has to be a declared stage
+        for name, stage in self.stages.items():
+            for dependency in stage['depends_on']:
+                if dependency not in self.stages:
+                    raise KeyError(f"Stage '{name}' depends on unknown stage '{dependency}'")
+
+        # The dependency graph has to be acyclic, otherwise the scheduler would never finish
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Circular dependency detected at stage '{name}'")
+            visiting.add(name)
+            for dependency in self.stages[name]['depends_on']:
+                visit(dependency)
+            visiting.remove(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def ready_stages(self, completed, submitted):
+        # Stages that have not started yet and whose dependencies have all finished
+        return [
+            name for name, stage in self.stages.items()
+            if name not in submitted and all(dependency in completed for dependency in stage['depends_on'])
+        ]
+
+    def run(self):
+        completed, submitted = set(), set()
+        running = {}
+        submit_times = {}
+        pipeline_start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(completed) < len(self.stages):
+                # Launch everything that is unblocked; independent stages run side by side
+                for name in self.ready_stages(completed, submitted):
+                    print(f"\n>>> Running {name}...")
+                    submit_times[name] = time.perf_counter()
+                    running[executor.submit(timed_stage, self.stages[name]['run'])] = name
+                    submitted.add(name)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.timings[name] = future.result()
+                    except Exception:
+                        # Let the stages that are already running finish before surfacing the error
+                        wait(running)
+                        print(f"\n>> {name} failed, skipping the remaining stages.")
+                        raise
+                    completed.add(name)
+                    waited = time.perf_counter() - submit_times[name] - self.timings[name]
+                    print(f"\n>> {name} finished in {self.timings[name]:.1f}s (queued for {max(waited, 0):.1f}s)")
+
+        print(f"\n>> Pipeline completed in {time.perf_counter() - pipeline_start:.1f}s")
+        return self.timings
+
+    def run_sequential(self):
+        # Runs the stages one at a time in dependency order (useful for debugging)
+        completed = set()
+        pipeline_start = time.perf_counter()
+
+        while len(completed) < len(self.stages):
+            for name in self.ready_stages(completed, completed):
+                print(f"\n>>> Running {name}...")
+                self.timings[name] = timed_stage(self.stages[name]['run'])
+                completed.add(name)
+
+        print(f"\n>> Pipeline completed in {time.perf_counter() - pipeline_start:.1f}s")
+        return self.timings
@@ -0,0 +1,184 @@
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import normalize
+
+from io_utils import save_pickle_atomic
+
+class SimilarityIndex:
+    # Approximate nearest-neighbour index for cosine similarity (inverted file over K-Means cells).
+    # Vectors are L2-normalized, grouped by their nearest K-Means centroid, and a query only
+    # scores the vectors in the n_probe cells whose centroids are closest to it.
+    def __init__(self, n_lists=None, n_probe=4, exact=False, random_state=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+
+        # Answer queries with exact search by default, for data sizes where it is as fast as probing the cells
+        self.exact = exact
+        self.random_state = random_state
+
+        # Empty initialization to be filled out by build()
+        # vectors and ids are stored sorted by cell; cell c holds rows offsets[c]:offsets[c + 1]
+        self.vectors = None
+        self.ids = None
+        self.centroids = None
+        self.offsets = None
+        self.id_positions = {}
+
+    def prepare(self, vectors):
+        # Sparse TF-IDF rows stay sparse, dense topic/feature vectors stay dense
+        vectors = sparse.csr_matrix(vectors) if sparse.issparse(vectors) else np.asarray(vectors, dtype=float)
+        return normalize(vectors)
+
+    def similarities(self, vectors, queries):
+        # Cosine similarity between normalized rows, as a dense (len(queries), len(vectors)) array
+        scores = queries @ vectors.T
+        return scores.toarray() if sparse.issparse(scores) else np.asarray(scores)
+
+    def build(self, vectors, ids):
+        vectors = self.prepare(vectors)
+        ids = np.asarray(ids)
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(vectors.shape[0])))
+        n_lists = min(n_lists, vectors.shape[0])
+
+        # The coarse quantizer only has to split the space roughly, so a single K-Means init is enough
+        kmeans = KMeans(n_init=1, n_clusters=n_lists, random_state=self.random_state)
+        assignments = kmeans.fit_predict(vectors)
+        self.centroids = normalize(kmeans.cluster_centers_)
+
+        # Store every vector once, grouped by cell, so a cell is a contiguous slice
+        order = np.argsort(assignments, kind='stable')
+        self.vectors = vectors[order]
+        self.ids = ids[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        self.id_positions = {item_id: position for position, item_id in enumerate(self.ids)}
+        print(f">> Similarity index built over {len(self.ids)} vectors in {n_lists} cells.")
+
+    def top_k(self, scores, positions, k):
+        # Row-wise top-k over a (queries, candidates) score matrix; -inf marks padding and excluded items.
+        # positions holds the index position of every candidate, per query, or as one row shared by all queries.
+        # Returns ids padded with -1 (None for non-integer ids) and scores padded with NaN when there are fewer than k.
+        if scores.shape[1] < k:
+            padding = k - scores.shape[1]
+            scores = np.pad(scores, ((0, 0), (0, padding)), constant_values=-np.inf)
+            positions = np.pad(positions, ((0, 0),) * (positions.ndim - 1) + ((0, padding),), constant_values=-1)
+
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k] if scores.shape[1] > k else np.tile(np.arange(k), (len(scores), 1))
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_positions = positions[best] if positions.ndim == 1 else np.take_along_axis(positions, best, axis=1)
+
+        missing = ~np.isfinite(best_scores) | (best_positions < 0)
+        fill = -1 if self.ids.dtype.kind in 'iu' else None
+        ids = np.where(missing, fill, self.ids[np.where(missing, 0, best_positions)])
+        return ids, np.where(missing, np.nan, best_scores)
+
+    def query(self, vectors, k=10, n_probe=None, exclude=None, exact=None):
+        # Batch top-k query: returns (ids, scores) arrays of shape (len(vectors), k)
+        if self.exact if exact is None else exact:
+            return self.exact_query(vectors, k=k, exclude=exclude)
+
+        queries = self.prepare(vectors)
+        n_queries = queries.shape[0]
+        n_probe = min(n_probe or self.n_probe, len(self.offsets) - 1)
+
+        # Rank the cells for every query at once
+        probes = np.argsort(-self.similarities(self.centroids, queries), axis=1)[:, :n_probe]
+        sizes = np.diff(self.offsets)[probes]
+
+        # Lay out each query's candidates in a padded (queries, max candidates) matrix:
+        # probe slot j of a query starts at column slot_starts[query, j]
+        slot_starts = np.cumsum(sizes, axis=1) - sizes
+        width = int(sizes.sum(axis=1).max())
+        scores = np.full((n_queries, width), -np.inf)
+        positions = np.full((n_queries, width), -1)
+
+        # Score each probed cell once against all the queries probing it
+        for cell in np.unique(probes):
+            rows, slots = np.nonzero(probes == cell)
+            start, end = self.offsets[cell], self.offsets[cell + 1]
+            columns = slot_starts[rows, slots][:, None] + np.arange(end - start)
+            scores[rows[:, None], columns] = self.similarities(self.vectors[start:end], queries[rows])
+            positions[rows[:, None], columns] = np.arange(start, end)
+
+        if exclude is not None:
+            scores[positions == np.asarray(exclude)[:, None]] = -np.inf
+
+        return self.top_k(scores, positions, k)
+
+    def exact_query(self, vectors, k=10, exclude=None):
+        # Brute-force top-k against every indexed vector (the baseline the index is measured against)
+        queries = self.prepare(vectors)
+        scores = self.similarities(self.vectors, queries)
+
+        # Every query has the same candidates, so one row of positions is shared by all of them
+        positions = np.arange(len(self.ids))
+
+        if exclude is not None:
+            scores[np.arange(len(scores)), np.asarray(exclude)] = -np.inf
+
+        return self.top_k(scores, positions, k)
+
+    def similar_to(self, ids, k=10, n_probe=None, exact=None):
+        # Find the k most similar items to items that are already in the index, leaving the items themselves out
+        positions = np.array([self.id_positions[item_id] for item_id in ids])
+        return self.query(self.vectors[positions], k=k, n_probe=n_probe, exclude=positions, exact=exact)
+
+    def benchmark(self, n_queries=200, k=10, n_probe=None, repeats=3):
+        # Compare recall and latency of the index against exact search, using indexed items as queries
+        rng = np.random.default_rng(self.random_state)
+        sample = rng.choice(self.ids, size=min(n_queries, len(self.ids)), replace=False)
+
+        # Best of a few repeats, so one-off scheduling noise does not decide the comparison
+        exact_time, approx_time = np.inf, np.inf
+        for _ in range(repeats):
+            start = time.perf_counter()
+            _, exact_scores = self.similar_to(sample, k=k, exact=True)
+            exact_time = min(exact_time, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            _, approx_scores = self.similar_to(sample, k=k, n_probe=n_probe, exact=False)
+            approx_time = min(approx_time, time.perf_counter() - start)
+
+        # Many reviews share the same wording, so a hit is any result scoring at least the exact k-th best score
+        kth_best = np.nanmin(exact_scores, axis=1, keepdims=True)
+        hits = np.nansum(approx_scores >= kth_best - 1e-9, axis=1)
+        recall = float(np.mean(hits / np.sum(~np.isnan(exact_scores), axis=1)))
+
+        results = {
+            'queries': len(sample),
+            'k': k,
+            'n_probe': n_probe or self.n_probe,
+            'recall': recall,
+            'exact_ms_per_query': 1000 * exact_time / len(sample),
+            'approx_ms_per_query': 1000 * approx_time / len(sample)
+        }
+        print(f">> Recall@{k}: {recall:.3f} | exact: {results['exact_ms_per_query']:.2f} ms/query"
+              f" | index: {results['approx_ms_per_query']:.2f} ms/query (n_probe={results['n_probe']})")
+        return results
+
+    def save(self, filepath):
+        save_pickle_atomic(self.__dict__, filepath)
+        print(f">> {os.path.basename(filepath)} saved!")
+
+    def load(self, filepath):
+        with open(filepath, 'rb') as f:
+            self.__dict__.update(pickle.load(f))
+
+if __name__ == "__main__":
+    # Benchmark the saved indexes against exact search, e.g. python similarity_index.py data/Review_Index.pkl
+    for filepath in sys.argv[1:] or ['data/Review_Index.pkl', 'data/Customer_Index.pkl']:
+        print(f"\n>>> Benchmarking {filepath}...")
+        index = SimilarityIndex()
+        index.load(filepath)
+        for n_probe in [1, 2, 4, 8]:
+            index.benchmark(n_probe=n_probe)